@@ -25,10 +25,11 @@ The revision tree is stored in the file system as plain text files to be
 tracked in version control.
 """
 
-from collections.abc import Iterator, Sequence
+from collections.abc import Sequence, Set
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import os
 import pathlib
-import re
-import secrets
 import typing as t
 
 
@@ -89,6 +90,66 @@ _REVISION_FILENAME = 'revision'
 """
 
 
+_INDEX_FILENAME = '.squill-index'
+"""Filename of the repository index.
+
+The index caches the metadata of all revisions in a single file, so that
+opening a repository does not require reading every revision file.  The
+revision files remain authoritative; a stale index is ignored.
+"""
+
+
+@functools.lru_cache(maxsize=4096)
+def _read_revision(path: pathlib.Path, mtime_ns: int, size: int) -> _Revision:
+    """Read revision metadata from the given path.
+
+    Results are cached keyed by path and file status, so repositories
+    opened repeatedly within one process only parse revision files that
+    changed.
+
+    :param path: path of revision metadata
+    :param mtime_ns: modification time of the metadata file
+    :param size: size of the metadata file
+    :raise ReadError: if the metadata is malformed
+    """
+    props = {}
+
+    # Revision files are tiny, so read them in one go instead of iterating
+    # a buffered file object line by line.
+    lines = path.read_text().splitlines(keepends=True)
+
+    for lineno, line in enumerate(lines, start=1):
+        key, sep, rest = line.removesuffix('\n').partition(':')
+        val = rest.lstrip()
+
+        # Accept only `Key: Value` lines with a non-empty key, at least
+        # one whitespace character after the colon, and a single-token
+        # value.
+        if (
+            not key
+            or not sep
+            or not val
+            or len(val) == len(rest)
+            or any(map(str.isspace, val))
+        ):
+            raise ReadError(
+                f"malformed line: {line!r}", path, lineno,
+            )
+
+        # Enforce unambiguous properties.
+        if key in props:
+            raise ReadError(
+                f"duplicate property: {key!r}", path, lineno,
+            )
+
+        props[key] = val
+
+    return _Revision(
+        key=path.parent.name,
+        parent=props.get('Parent'),
+    )
+
+
 class Repository:
     """Repository of database revisions.
     """
@@ -100,7 +161,38 @@ class Repository:
         :raise ReadError: if reading the repository fails
         """
         self._path = path
-        self._revs = {r.key: r for r in self._read_all()}
+        self._revs = self._read_all()
+
+        # Index child revisions by parent and maintain the set of heads
+        # incrementally, so that heads are available without scanning all
+        # revisions on every access.
+        self._children: dict[str, set[str]] = {}
+        self._heads = set(self._revs)
+
+        for rev in self._revs.values():
+            if rev.parent:
+                self._children.setdefault(rev.parent, set()).add(rev.key)
+                self._heads.discard(rev.parent)
+
+        # Cache of complete revision sequences keyed by target, with the
+        # position of every revision in its sequence.  Invalidated whenever
+        # a revision is written.
+        self._seq_cache: dict[str, tuple[list[str], dict[str, int]]] = {}
+
+        # Buffered entropy for generating revision keys, refilled on demand
+        # to amortize one urandom call over many keys.
+        self._rand_buf = bytearray()
+
+        # Revisions whose chain to the root is known to be free of cycles.
+        # Walks through these revisions skip the cycle bookkeeping.
+        # Invalidated when a revision changes its parent.
+        self._acyclic: set[str] = set()
+
+        # Memoized topological index, the distance of a revision to its
+        # root, built lazily along parent chains.  Parents always have a
+        # smaller index than their descendants, which makes reachability
+        # queries cheap.  Invalidated when a revision changes its parent.
+        self._depth: dict[str, int] = {}
 
     @property
     def path(self) -> pathlib.Path:
@@ -112,8 +204,7 @@ class Repository:
 
         Head revisions are all revisions that are not also parent revisions.
         """
-        parents = {r.parent for r in self._revs.values() if r.parent}
-        return self._revs.keys() - parents
+        return set(self._heads)
 
     @property
     def head(self) -> str | None:
@@ -153,34 +244,43 @@ class Repository:
         # Use head as default target.
         target = target or self.head
 
-        # Collect revisions in reverse, between target and base.
-        seq: list[str] = []
-
-        # The current revision.
-        key = target
+        # Reuse the cached sequence of an earlier call with the same target.
+        if target and target in self._seq_cache:
+            chain, chain_pos = self._seq_cache[target]
 
-        # Follow parents until reaching the base or detecting a cycle.
-        while key:
-            if key in seq:
-                # Omit revisions that we collected but which are not part of
-                # the detected cycle.
-                seq = seq[seq.index(key):]
-                raise CycleError(list(reversed(seq)))
+            if not base:
+                return list(chain)
 
-            seq.append(key)
+            if base not in chain_pos:
+                raise SequenceError(base, target)
 
-            if base and key == base:
-                break  # reached the base
+            return chain[chain_pos[base]:]
 
-            key = self._revs[key].parent
-
-        # Check if the reached base is the specified one.
-        if seq and base and seq[-1] != base:
+        # Collect revisions in reverse, between target and base.
+        if target:
+            seq, reached_base = self._walk_parents(target, base=base)
+        else:
+            seq, reached_base = [], False
+
+        # The walk collected the revisions from target towards base.  The
+        # list is local to this call, so reverse it in place instead of
+        # allocating a reversed copy.
+        seq.reverse()
+
+        # Unless the walk stopped at the requested base it ran all the way
+        # to the root, so cache the complete sequence for later calls with
+        # the same target, even if the base turns out to be unreachable.
+        if target and not reached_base:
+            self._seq_cache[target] = (
+                seq, {key: i for i, key in enumerate(seq)},
+            )
+            seq = list(seq)
+
+        if seq and base and not reached_base:
             assert target
             raise SequenceError(base, target)
 
-        # Return the revisions between base and target.
-        return list(reversed(seq))
+        return seq
 
     def add(
         self,
@@ -206,10 +306,17 @@ class Repository:
         if rev.parent and rev.parent not in self._revs:
             raise ValueError(f"unknown parent {rev.parent!r}")
 
-        # Create the revision scripts.
-        (self._path / rev.key).mkdir(parents=True)
-        (self._path / rev.key / 'deploy.sql').touch()
-        (self._path / rev.key / 'revert.sql').touch()
+        # Create the revision directory and its empty scripts directly,
+        # without resolving the path anew for every file.
+        rev_dir = os.fspath(self._path / rev.key)
+        os.makedirs(rev_dir)
+
+        for script in ('deploy.sql', 'revert.sql'):
+            os.close(os.open(
+                os.path.join(rev_dir, script),
+                os.O_CREAT | os.O_WRONLY,
+                0o666,
+            ))
 
         self._write(rev)
 
@@ -231,54 +338,287 @@ class Repository:
             raise ValueError(f"new parent {parent!r} must be a current head")
 
         # Prevent creation of cycle, i.e. rebasing on itself or any ancestor.
-        # The new parent must already be reachable from the revision before
-        # rebasing if the dependency on the new parent would cause a cycle.
-        try:
-            if cycle := self.sequence(base=key, target=parent):
-                raise CycleError(cycle)
-        except SequenceError:
-            pass
+        # The new parent must not be a descendant of the revision, which is
+        # the case exactly if the revision is among the parent's ancestors.
+        if key == parent or self._is_ancestor(key, parent):
+            raise CycleError(self.sequence(base=key, target=parent))
 
         rev = self._revs[key]._replace(parent=parent)
 
         self._write(rev)
 
     def _random_key(self) -> str:
-        return secrets.token_hex(6)
+        if len(self._rand_buf) < 6:
+            self._rand_buf += os.urandom(252)
+
+        key = self._rand_buf[:6].hex()
+        del self._rand_buf[:6]
+
+        return key
+
+    def _walk_parents(
+        self,
+        start: str,
+        *,
+        base: str | None = None,
+    ) -> tuple[list[str], bool]:
+        """Collect the chain of revisions from start towards the root.
+
+        The walk stops early when reaching the optional base.  Revisions of
+        completed walks are remembered as acyclic, so later walks skip the
+        cycle bookkeeping once they enter a known chain.
+
+        :param start: revision to start from
+        :param base: optional revision to stop at
+        :return: collected chain in walk order and whether the walk stopped
+            at the base
+        :raise CycleError: if revisions form a cycle
+        """
+        seq: list[str] = []
+
+        # Track the collected revisions and their positions in `seq` to
+        # check for cycles in constant time.
+        pos: dict[str, int] = {}
+
+        # The current revision.
+        key: str | None = start
+
+        # Follow parents until reaching the base or detecting a cycle.
+        while key:
+            if key not in self._acyclic:
+                if key in pos:
+                    # Omit revisions that we collected but which are not
+                    # part of the detected cycle.
+                    seq = seq[pos[key]:]
+                    seq.reverse()
+                    raise CycleError(seq)
+
+                pos[key] = len(seq)
 
-    def _read_all(self) -> Iterator[_Revision]:
-        return map(self._read, self._path.glob(f'*/{_REVISION_FILENAME}'))
+            seq.append(key)
+
+            if base and key == base:
+                return seq, True
+
+            key = self._revs[key].parent
+
+        # The walk reached the root, so all collected revisions are known
+        # to be free of cycles.
+        self._acyclic.update(seq)
+
+        return seq, False
+
+    def _depth_of(self, key: str) -> int:
+        """Return the distance of the given revision to its root.
+
+        Depths are memoized, so repeated queries only walk parent chains
+        that were not resolved before.
+
+        :param key: revision key
+        :return: number of ancestors of the revision
+        :raise CycleError: if revisions form a cycle
+        """
+        # Walk towards the root until reaching a revision with known depth,
+        # collecting unresolved revisions along the way.
+        chain: list[str] = []
+        pos: dict[str, int] = {}
+        cur: str | None = key
+
+        while cur and cur not in self._depth:
+            if cur in pos:
+                cycle = chain[pos[cur]:]
+                cycle.reverse()
+                raise CycleError(cycle)
+
+            pos[cur] = len(chain)
+            chain.append(cur)
+            cur = self._revs[cur].parent
+
+        # Resolve the collected revisions towards key, so that every parent
+        # is resolved before its children.
+        for k in reversed(chain):
+            p = self._revs[k].parent
+            self._depth[k] = 0 if p is None else self._depth[p] + 1
+
+        return self._depth[key]
+
+    def _is_ancestor(self, key: str, other: str) -> bool:
+        """Check if one revision is an ancestor of another revision.
+
+        Any ancestor has a smaller depth than its descendants, so the check
+        immediately fails unless `other` is deeper than `key`, and otherwise
+        only walks the chain between the two depths.
 
-    def _read(self, path: pathlib.Path) -> _Revision:
-        props = {}
+        :param key: revision key of the potential ancestor
+        :param other: revision key of the potential descendant
+        :raise CycleError: if revisions form a cycle
+        """
+        depth = self._depth_of(key)
+        cur = other
 
-        with path.open() as fp:
-            for lineno, line in enumerate(fp, start=1):
-                match = re.match(r'^([^:]+):\s+(\S+)$', line)
+        while self._depth_of(cur) > depth:
+            parent = self._revs[cur].parent
+            assert parent
+            cur = parent
 
-                if not match:
-                    raise ReadError(
-                        f"malformed line: {line!r}", path, lineno,
-                    )
+        return cur == key
 
-                key, val = match.groups()
+    def _read_all(self) -> dict[str, _Revision]:
+        revs: dict[str, _Revision] = {}
 
-                # Enforce unambiguous properties.
-                if key in props:
-                    raise ReadError(
-                        f"duplicate property: {key!r}", path, lineno,
-                    )
+        try:
+            entries = os.scandir(self._path)
+        except FileNotFoundError:
+            # A repository without a directory has no revisions.
+            return revs
+
+        # Collect the metadata paths of all revisions along with their
+        # latest modification time to judge the freshness of the index.
+        paths: dict[str, tuple[pathlib.Path, os.stat_result]] = {}
+        newest = 0
+
+        with entries:
+            for entry in entries:
+                # Skip hidden entries, e.g. version control directories.
+                if entry.name.startswith('.') or not entry.is_dir():
+                    continue
+
+                path = pathlib.Path(entry.path, _REVISION_FILENAME)
+
+                try:
+                    status = path.stat()
+                except FileNotFoundError:
+                    # Directories without revision metadata, e.g. created
+                    # manually, are not revisions.
+                    continue
+
+                paths[entry.name] = (path, status)
+                newest = max(newest, status.st_mtime_ns)
+
+        if (index := self._read_index(paths.keys(), newest)) is not None:
+            return index
+
+        # Read small repositories serially, because starting a thread pool
+        # would outweigh the few reads it could overlap.
+        if len(paths) < 8:
+            for path, status in paths.values():
+                rev = _read_revision(path, status.st_mtime_ns, status.st_size)
+                revs[rev.key] = rev
+
+            return revs
+
+        # Reading many revision files is blocking I/O that threads overlap
+        # well, since the interpreter lock is released while reading.
+        with ThreadPoolExecutor(max_workers=min(32, len(paths))) as pool:
+            parsed = pool.map(
+                _read_revision,
+                (path for path, _ in paths.values()),
+                (status.st_mtime_ns for _, status in paths.values()),
+                (status.st_size for _, status in paths.values()),
+            )
+
+            for rev in parsed:
+                revs[rev.key] = rev
+
+        return revs
+
+    def _read_index(
+        self,
+        keys: Set[str],
+        newest: int,
+    ) -> dict[str, _Revision] | None:
+        """Read all revisions from the repository index.
+
+        The index is ignored when it is missing, malformed, not strictly
+        newer than every revision file, or does not cover exactly the
+        revisions found on disk.
+
+        :param keys: keys of all revisions found on disk
+        :param newest: latest modification time of any revision file
+        :return: revisions from the index, or `None` if the index is stale
+        """
+        path = self._path / _INDEX_FILENAME
 
-                props[key] = val
+        try:
+            status = path.stat()
 
-        return _Revision(
-            key=path.parent.name,
-            parent=props.get('Parent'),
+            if status.st_mtime_ns <= newest:
+                return None
+
+            text = path.read_text()
+        except OSError:
+            return None
+
+        revs = {}
+
+        for line in text.splitlines():
+            key, _, parent = line.partition(' ')
+            revs[key] = _Revision(key=key, parent=parent or None)
+
+        if revs.keys() != keys:
+            return None
+
+        return revs
+
+    def _write_index(self) -> None:
+        """Write the repository index with the metadata of all revisions.
+
+        The index is replaced atomically so that a concurrent reader never
+        sees a partial index.
+        """
+        data = ''.join(
+            f"{r.key} {r.parent}\n" if r.parent else f"{r.key}\n"
+            for r in self._revs.values()
         )
 
+        tmp = self._path / f'{_INDEX_FILENAME}.tmp'
+        tmp.write_text(data)
+
+        os.replace(tmp, self._path / _INDEX_FILENAME)
+
     def _write(self, rev: _Revision) -> None:
-        with (self._path / rev.key / _REVISION_FILENAME).open('w') as fp:
-            if rev.parent:
-                fp.write(f"Parent: {rev.parent}\n")
+        data = f"Parent: {rev.parent}\n".encode() if rev.parent else b""
+
+        path = self._path / rev.key / _REVISION_FILENAME
+        tmp = f'{path}.tmp'
 
+        fd = os.open(tmp, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o666)
+
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+        # Replace the metadata atomically, so that a concurrent reader
+        # never sees a partially written file.
+        os.replace(tmp, path)
+
+        old = self._revs.get(rev.key)
         self._revs[rev.key] = rev
+
+        self._write_index()
+
+        # Keep the children index and the set of heads up to date.
+        if old is None and not self._children.get(rev.key):
+            self._heads.add(rev.key)
+
+        if old and old.parent and old.parent != rev.parent:
+            children = self._children[old.parent]
+            children.discard(rev.key)
+
+            if not children and old.parent in self._revs:
+                self._heads.add(old.parent)
+
+        if rev.parent and (old is None or old.parent != rev.parent):
+            self._children.setdefault(rev.parent, set()).add(rev.key)
+            self._heads.discard(rev.parent)
+
+        # Cached sequences may be invalid after changing the revision graph.
+        self._seq_cache.clear()
+
+        # A parent change invalidates the depths and acyclicity of all
+        # descendants of the rewritten revision.  Adding a revision
+        # invalidates nothing.
+        if old and old.parent != rev.parent:
+            self._acyclic.clear()
+            self._depth.clear()
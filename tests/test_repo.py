@@ -1,4 +1,4 @@
-from collections.abc import Iterator
+from collections.abc import Iterator, Sequence
 import contextlib
 import pathlib
 
@@ -14,16 +14,19 @@ def repo(tmp_path: pathlib.Path) -> Iterator[Repository]:
         yield Repository(pathlib.Path('repo'))
 
 
+def snapshot(repo: Repository) -> dict[str, Sequence[str]]:
+    """Return the sequences of all head revisions, keyed by head.
+
+    Two repositories with equal snapshots have the same revision graph.
+    """
+    return {h: repo.sequence(target=h) for h in repo.heads}
+
+
 def assert_persisted(expected: Repository) -> None:
     """Assert that the expected repository is persisted and that reading the
     repository again yields the same revision graph.
     """
-    repo = Repository(expected.path)
-
-    assert repo.heads == expected.heads
-
-    for head in repo.heads:
-        assert repo.sequence(target=head) == expected.sequence(target=head)
+    assert snapshot(Repository(expected.path)) == snapshot(expected)
 
 
 @contextlib.contextmanager
@@ -31,13 +34,11 @@ def assert_unmodified(repo: Repository) -> Iterator[None]:
     """Context manager for asserting that a repository is not modified in the
     block.
     """
-    revs_before = {h: repo.sequence(target=h) for h in repo.heads}
+    revs_before = snapshot(repo)
 
     yield
 
-    revs_after = {h: repo.sequence(target=h) for h in repo.heads}
-
-    assert revs_after == revs_before
+    assert snapshot(repo) == revs_before
     assert_persisted(repo)
 
 
@@ -229,6 +230,16 @@ def test_read_duplicate_property(repo: Repository) -> None:
     assert str(excinfo.value) == f"duplicate property: 'foo' ({path}:2)"
 
 
+def test_read_without_index(repo: Repository) -> None:
+    r0 = repo.add()
+    r1 = repo.add(parent=r0)
+
+    # The index is merely a cache, so the repository must open without it.
+    (repo.path / '.squill-index').unlink()
+
+    assert snapshot(Repository(repo.path)) == {r1: [r0, r1]}
+
+
 def test_read_no_head(repo: Repository) -> None:
     r0 = repo.add()
     r1 = repo.add(parent=r0)